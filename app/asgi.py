@@ -0,0 +1,567 @@
+# Project: SIMPLE DESIGN OF A REST API FOR PAYMENTS
+# Asynchronous (ASGI) server of the API.
+
+# DESCRIPTION:
+# Serves the API on an asyncio event loop. The routes that spend most of their time waiting for the database
+# (listing, reading and making payments) are native async views using an async SQLAlchemy engine (aiosqlite for
+# SQLite, asyncpg for PostgreSQL), so a slow client only holds a coroutine, not a thread. Every other request
+# (users, login, bulk payments, exports, streams, archive, 'Idempotency-Key', ...) is passed to the Flask app,
+# which runs it in a thread pool. Both share the same app, config, token cache and limiters.
+#
+# Requires the optional packages 'starlette', 'aiosqlite' (or 'asyncpg') and 'uvicorn'.
+#
+# Usage (inside the 'app' folder):
+#   uvicorn asgi:app --port 5000
+
+import asyncio
+import json
+import os
+from functools import wraps
+
+from sqlalchemy import event, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware.wsgi import WSGIMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, Response
+from starlette.routing import Mount, Route
+from werkzeug.datastructures import MIMEAccept, MultiDict
+from werkzeug.exceptions import BadRequest
+from werkzeug.http import parse_accept_header, parse_etags, quote_etag
+
+from app import (create_app, engine_options, sqlite_pragmas, check_rate_limit, too_many_requests, collection_etag, payment_versions,
+                 archive_requested, page_limit, export_mimetype, filter_payments, order_payments, payment_page, process_payment,
+                 payment_stats_deltas, upsert_statement, serialize_payment, dumps, read_scope, shareable, start_payment_workers,
+                 UserSnapshot, User, Payment, PaymentStats, CollectionVersion, PAYMENT_COLUMNS, PAYMENT_SORT_COLUMNS)
+
+flask_app = create_app()
+state = flask_app.extensions['payments']
+
+# The Flask app, run in a thread pool, serves everything the native routes don't...
+flask = WSGIMiddleware(flask_app)
+
+
+# -------------------- #
+#  ASYNC DATABASE      #
+# ==================== #
+
+def async_database_uri(app):
+
+    """
+    URI of the async engine, with the same database as the Flask app. A relative SQLite path is resolved
+    against the folder of the app, as Flask-SQLAlchemy does.
+
+    :param app: Flask app.
+    :return: URI with an async driver ('sqlite+aiosqlite' or 'postgresql+asyncpg').
+    """
+
+    url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+
+    if url.get_backend_name() == 'sqlite':
+        database = url.database
+
+        if database and database != ':memory:' and not os.path.isabs(database):
+            database = os.path.join(app.root_path, database)
+
+        return url.set(drivername='sqlite+aiosqlite', database=database)
+
+    return url.set(drivername=f'{url.get_backend_name()}+asyncpg')
+
+
+def async_engine_options(app):
+
+    """
+    :param app: Flask app.
+    :return: The same options of the Flask engine ('engine_options'), with a pool usable by asyncio.
+    """
+
+    options = engine_options(app.config)
+
+    if options.get('poolclass') is QueuePool:
+        options['poolclass'] = AsyncAdaptedQueuePool
+
+    return options
+
+
+engine = create_async_engine(async_database_uri(flask_app), **async_engine_options(flask_app))
+Session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+if engine.dialect.name == 'sqlite':
+
+    def set_async_sqlite_pragmas(dbapi_connection, connection_record):
+
+        # The same pragmas of the connections of the Flask app...
+        cursor = dbapi_connection.cursor()
+
+        for pragma in sqlite_pragmas(flask_app.config):
+            cursor.execute(pragma)
+
+        cursor.close()
+
+    event.listen(engine.sync_engine, 'connect', set_async_sqlite_pragmas)
+
+
+# -------------------- #
+#  HELPERS             #
+# ==================== #
+
+def from_flask(response):
+
+    """
+    :param response: Response built by the Flask app (e.g. the 429 of 'check_rate_limit').
+    :return: The same response for Starlette.
+    """
+
+    return Response(response.get_data(), status_code=response.status_code, headers=dict(response.headers))
+
+
+def query_args(request):
+
+    """
+    :return: Arguments of the query string as a MultiDict, the same type as Flask's 'request.args'.
+    """
+
+    return MultiDict(request.query_params.multi_items())
+
+
+async def read_json(request):
+
+    """
+    Same as Flask's 'request.get_json()': the body is only read as JSON with a JSON 'Content-Type', otherwise
+    (or if it isn't valid JSON) the request is a 400 (Bad Request).
+
+    :return: Decoded body.
+    :raise BadRequest: If the body isn't JSON.
+    """
+
+    mimetype = request.headers.get('Content-Type', '').split(';')[0].strip()
+
+    if mimetype != 'application/json' and not mimetype.endswith('+json'):
+        raise BadRequest()
+
+    try:
+        return json.loads(await request.body())
+    except ValueError:
+        raise BadRequest()
+
+
+def check_rate_limit_sync(key, name):
+
+    """
+    Runs 'check_rate_limit' of the Flask app.
+
+    :return: None if the request is allowed, otherwise the 429 (Too Many Requests) response.
+    """
+
+    with flask_app.app_context():
+        refused = check_rate_limit(key, name)
+
+    return None if refused is None else from_flask(refused)
+
+
+async def rate_limited(key, name):
+
+    """
+    Async version of 'check_rate_limit'. The buckets in a SQLite file shared by the processes may wait for
+    its lock (up to 'SQLITE_BUSY_TIMEOUT'), so they're taken in a thread, without blocking the event loop.
+
+    :return: None if the request is allowed, otherwise the 429 (Too Many Requests) response.
+    """
+
+    if not flask_app.config['RATE_LIMIT_ENABLED']:
+        return None
+
+    if flask_app.config['RATE_LIMIT_STORAGE'] == 'memory':
+        return check_rate_limit_sync(key, name)
+
+    return await run_in_threadpool(check_rate_limit_sync, key, name)
+
+
+class NativeRoute:
+
+    """
+    ASGI app of a route served natively. The requests the route can't serve ('served' returns False)
+    are passed to the Flask app.
+    """
+
+    def __init__(self, endpoint, served=None):
+        self.endpoint = endpoint
+        self.served = served
+
+    async def __call__(self, scope, receive, send):
+        request = Request(scope, receive)
+
+        if self.served is not None and not self.served(request):
+            await flask(scope, receive, send)
+            return
+
+        response = await self.endpoint(request)
+        await response(scope, receive, send)
+
+
+# -------------------------------- #
+# DECORATOR TO VALIDATE THE TOKENS #
+# ================================ #
+
+def token_required(f):
+
+    """
+    Async version of the decorator 'token_required' of the Flask app, with the same responses. Tokens
+    already verified are taken from the token cache shared with the Flask app, the others are verified by
+    its token service and their user is read by the async session, which is then passed to the route.
+    """
+
+    @wraps(f)
+
+    async def decorated(request):
+
+        token = request.headers.get('X-Access-Token')
+
+        if not token:
+            return JSONResponse({'message': 'Token is missing!'}, 401)
+
+        async with Session() as session:
+            cached = state['token_cache'].get(token)
+
+            if cached is not None:
+                current_user = cached[1]
+
+            else:
+                try:
+                    data = state['token_service'].verify(token)
+
+                    result = await session.execute(select(User.id, User.public_id, User.username, User.admin)
+                                                   .filter(User.public_id == data['public_id']))
+                    user = result.first()
+
+                except Exception:
+                    return JSONResponse({'message': 'Token is invalid!'}, 401)
+
+                if not user:
+                    return JSONResponse({'message': 'Token is invalid!'}, 401)
+
+                current_user = UserSnapshot(user)
+                state['token_cache'].put(token, data, current_user)
+
+            return await rate_limited(current_user.public_id, 'USER') or await f(request, session, current_user)
+
+    return decorated
+
+
+def user_concurrency_limited(f):
+
+    """
+    Async version of the decorator 'user_concurrency_limited', sharing the limits of the Flask app.
+    """
+
+    @wraps(f)
+
+    async def decorated(request, session, current_user):
+
+        if not flask_app.config['RATE_LIMIT_ENABLED']:
+            return await f(request, session, current_user)
+
+        if not state['user_concurrency'].acquire(current_user.public_id):
+            with flask_app.app_context():
+                return from_flask(too_many_requests(1))
+
+        try:
+            return await f(request, session, current_user)
+
+        finally:
+            state['user_concurrency'].release(current_user.public_id)
+
+    return decorated
+
+
+def conditional(f):
+
+    """
+    Async version of 'conditional(payment_versions)': same ETags as the Flask app, and 304 (Not Modified)
+    when the client already has the current version.
+    """
+
+    @wraps(f)
+
+    async def decorated(request, session, current_user):
+
+        names = payment_versions(current_user)
+        result = await session.execute(select(CollectionVersion.name, CollectionVersion.version)
+                                       .filter(CollectionVersion.name.in_(names)))
+        rows = request.state.collection_versions = dict(result.all())
+        etag = collection_etag(current_user, names, rows, f'{request.url.path}?{request.url.query}',
+                               request.headers.get('Accept', ''))
+
+        if parse_etags(request.headers.get('If-None-Match')).contains(etag):
+            # The client already has this version...
+
+            return Response(status_code=304, headers={'ETag': quote_etag(etag)})
+
+        response = await f(request, session, current_user)
+
+        if response.status_code == 200:
+            response.headers['ETag'] = quote_etag(etag)
+            response.headers['Vary'] = 'Accept'
+
+        return response
+
+    return decorated
+
+
+# Reads in progress of the native routes (see 'coalesced')...
+in_flight = {}
+
+
+def coalesced(f):
+
+    """
+    Async version of the decorator 'coalesced': identical reads running at the same time in the event loop
+    share the response body built by the first one. Must be used after 'conditional'.
+    """
+
+    @wraps(f)
+
+    async def decorated(request, session, current_user):
+
+        if not flask_app.config['SINGLE_FLIGHT_ENABLED']:
+            return await f(request, session, current_user)
+
+        key = (request.url.path, request.url.query, request.headers.get('Accept', ''), read_scope(current_user),
+               tuple(sorted(request.state.collection_versions.items())))
+        future = in_flight.get(key)
+
+        if future is not None:
+            # Shielded, so a client that goes away doesn't cancel the read of the others...
+            shared = await asyncio.shield(future)
+
+            if shared is not None:
+                body, status, media_type = shared
+                return Response(body, status_code=status, media_type=media_type)
+
+            # The first request failed (or got an error)...
+            return await f(request, session, current_user)
+
+        future = in_flight[key] = asyncio.get_running_loop().create_future()
+        shared = None
+
+        try:
+            response = await f(request, session, current_user)
+
+            if shareable(response.status_code):
+                shared = (response.body, response.status_code, response.media_type)
+
+            return response
+
+        finally:
+            del in_flight[key]
+            future.set_result(shared)
+
+    return decorated
+
+
+def json_response(obj, status=200):
+    return Response(dumps(obj), status_code=status, media_type='application/json')
+
+
+def payment_select(current_user):
+
+    """
+    :return: Select of the 'PAYMENT_COLUMNS' the current user is allowed to see (see 'payment_query').
+    """
+
+    query = select(*PAYMENT_COLUMNS)
+
+    if not current_user.admin:
+        query = query.filter(Payment.user_id == current_user.id)
+
+    return query
+
+
+# ----------------- #
+#     HOME PAGE     #
+# ================= #
+
+async def index(request):
+    return PlainTextResponse("Bem vindo! Este eh um projeto de uma REST API simples para efetuar pagamentos.")
+
+
+# ------------------------------------ #
+# TAKE ALL PAYMENTS MADE (ONLY ADMINS) #
+# ==================================== #
+
+def lists_json(request):
+
+    """
+    :return: True if the listing is a JSON list or page, the exports, streams and archive are served by Flask.
+    """
+
+    args = query_args(request)
+    accept_mimetypes = parse_accept_header(request.headers.get('Accept'), MIMEAccept)
+
+    return (export_mimetype(args, accept_mimetypes) == 'application/json' and not archive_requested(args)
+            and args.get('stream') not in ('1', 'true'))
+
+
+@token_required
+@conditional
+@coalesced
+@user_concurrency_limited
+async def get_all_payments(request, session, current_user):
+
+    """
+    Same as the route 'get_all_payments' of the Flask app, for the JSON listings (filters, sort and pages).
+    """
+
+    args = query_args(request)
+    config = flask_app.config
+
+    query, error = filter_payments(payment_select(current_user), current_user, args)
+
+    if error:
+        return JSONResponse(*error)
+
+    sort = args.get('sort', 'payment_id')
+    query = order_payments(query, sort, args.get('after') or None)
+
+    if query is None:
+        return JSONResponse({'message': 'Invalid sort or cursor!', 'sort': list(PAYMENT_SORT_COLUMNS)}, 400)
+
+    if 'limit' in args or 'after' in args:
+        # Returns only one page of payments...
+
+        limit = page_limit(args, config)
+
+        if limit is None:
+            return JSONResponse({'message': 'Invalid limit!'}, 400)
+
+        result = await session.execute(query.limit(limit + 1))
+        output, next_cursor = payment_page(result.all(), sort, limit)
+
+        return json_response({'payments': output, 'next': next_cursor})
+
+    result = await session.execute(query)
+
+    return json_response({'payments': [serialize_payment(row) for row in result.all()]})
+
+
+# ------------------------------ #
+# TAKE AN ESPECIFIC PAYMENT MADE #
+# ============================== #
+
+@token_required
+async def get_one_payment(request, session, current_user):
+
+    """
+    Same as the route 'get_one_payment' of the Flask app (without 'archive=1', served by Flask), sharing
+    its payment cache.
+    """
+
+    payment_id = request.path_params['payment_id']
+    entry = state['payment_cache'].get(payment_id)
+
+    if entry is None:
+        result = await session.execute(payment_select(current_user).filter(Payment.id == payment_id))
+        row = result.first()
+
+        if not row:
+            return JSONResponse({'message': 'No payment found!'}, 404)
+
+        entry = state['payment_cache'].put(row[0], row[1], dumps({'payment': serialize_payment(row)}))
+
+    if not entry.readable_by(current_user):
+        return JSONResponse({'message': 'No payment found!'}, 404)
+
+    if parse_etags(request.headers.get('If-None-Match')).contains(entry.etag):
+        return Response(status_code=304, headers={'ETag': quote_etag(entry.etag)})
+
+    return Response(entry.body, media_type='application/json', headers={'ETag': quote_etag(entry.etag)})
+
+
+# ---------------- #
+#  MAKE A PAYMENT  #
+# ================ #
+
+def makes_sync_payment(request):
+
+    """
+    :return: True if the payment is processed right away. The asynchronous mode and the requests with an
+             'Idempotency-Key' are served by Flask.
+    """
+
+    return flask_app.config['PAYMENT_PROCESSING'] != 'async' and 'Idempotency-Key' not in request.headers
+
+
+@token_required
+async def make_a_payment(request, session, current_user):
+
+    """
+    Same as the route 'make_a_payment' of the Flask app: the payment, its statistics and the versions of
+    the payments are written in one transaction (or in the group commit, with 'PAYMENT_GROUP_COMMIT').
+    """
+
+    try:
+        data = await read_json(request)
+    except BadRequest as error:
+        return from_flask(error.get_response())
+
+    new_payment, response, status = process_payment(current_user.id, data)
+
+    if new_payment is not None and flask_app.config['PAYMENT_GROUP_COMMIT']:
+        # Committed by the committer thread of the Flask app, together with the payments of the other requests...
+
+        loop = asyncio.get_running_loop()
+        done = loop.create_future()
+        pending = state['payment_committer'].submit(
+            new_payment, lambda: loop.call_soon_threadsafe(lambda: done.done() or done.set_result(None)))
+
+        try:
+            await asyncio.wait_for(asyncio.shield(done), flask_app.config['PAYMENT_GROUP_COMMIT_TIMEOUT'])
+
+        except asyncio.TimeoutError:
+            if pending.cancel():
+                return JSONResponse({'message': 'The payment was not made, please try again later!'}, 503,
+                                    {'Retry-After': '1'})
+
+            # Already being committed, it's always finished...
+            await asyncio.shield(done)
+
+        if pending.error is not None:
+            raise pending.error
+
+    elif new_payment is not None:
+        dialect = engine.dialect.name
+        session.add(new_payment)
+
+        for keys, increments in payment_stats_deltas([new_payment], 1):
+            await session.execute(upsert_statement(dialect, PaymentStats, keys, increments))
+
+        for name in ('payments', f'payments:{new_payment.user_id}'):
+            await session.execute(upsert_statement(dialect, CollectionVersion, {'name': name}, {'version': 1}))
+
+        await session.commit()
+
+    return JSONResponse(response, status)
+
+
+# ------------------- #
+# APPLICATION (ASGI)  #
+# =================== #
+
+app = Starlette(routes=[
+    Route('/home', NativeRoute(index), methods=['GET']),
+    Route('/payment', NativeRoute(get_all_payments, lists_json), methods=['GET']),
+    Route('/payment', NativeRoute(make_a_payment, makes_sync_payment), methods=['POST']),
+    Route('/payment/{payment_id:int}', NativeRoute(get_one_payment, lambda request: not archive_requested(query_args(request))),
+          methods=['GET']),
+    Mount('', app=flask),
+], on_startup=[lambda: start_payment_workers(flask_app)], on_shutdown=[engine.dispose])
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    uvicorn.run(app, port=int(os.environ.get('PORT', 5000)))
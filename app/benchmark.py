@@ -0,0 +1,475 @@
+# Project: SIMPLE DESIGN OF A REST API FOR PAYMENTS
+# Benchmark and load test of the routes of the API.
+
+# DESCRIPTION:
+# Seeds a fresh SQLite database with a configurable number of users and payments and drives every route
+# of the API, through the Flask test client and/or a local WSGI server, at the given concurrency levels.
+# For each route it reports the p50/p95/p99 latencies, the throughput, the responses with an unexpected status
+# and the peak RSS of the process, and compares them against a baseline stored in a JSON file.
+#
+# Usage (inside the 'app' folder):
+#   python3 benchmark.py --users 100 --payments 10000 --requests 200 --concurrency 1,8
+#   python3 benchmark.py --save-baseline baseline.json
+#   python3 benchmark.py --baseline baseline.json --check
+#   python3 benchmark.py --tokens 20000
+
+import argparse
+import atexit
+import base64
+import datetime
+import http.client
+import itertools
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import jwt
+from werkzeug.security import generate_password_hash
+from werkzeug.serving import make_server, WSGIRequestHandler
+
+from app import (create_app, db, User, Payment, rebuild_payment_stats, parse_token_keys, TokenService, MemorySessions,
+                 SQLiteSessions)
+
+# The benchmark has its own app, with a fresh database and without rate limits nor limits of concurrency per
+# user (all its requests come from the same user and IP address, they would get 429)...
+BENCH_DIR = tempfile.mkdtemp(prefix='payments-bench-')
+atexit.register(shutil.rmtree, BENCH_DIR, True)
+app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(BENCH_DIR, 'bench.db')}",
+                  'SECRET_KEY': 'bench-secret', 'RATE_LIMIT_ENABLED': False})
+
+ADMIN = ('bench-admin', 'admin')
+REGULAR = ('bench-user-1', 'user')
+
+
+# ---------------------- #
+#  SEEDING THE DATABASE  #
+# ====================== #
+
+def seed(users, payments, doomed):
+
+    """
+    Creates the tables and fills them. User 1 is an admin, the others are regular users, and the payments are
+    spread between all users. Some extra users and payments are created to be deleted by the benchmark.
+
+    :param users: Number of users.
+    :param payments: Number of payments.
+    :param doomed: Number of extra users and payments to be deleted by the delete routes.
+    """
+
+    db.create_all()
+
+    # All users share the same hash, so seeding doesn't spend time hashing...
+    admin_password = generate_password_hash(ADMIN[1], method='sha256')
+    password = generate_password_hash(REGULAR[1], method='sha256')
+
+    rows = [{'id': 1, 'public_id': 'bench-admin', 'username': ADMIN[0], 'password': admin_password, 'admin': True}]
+    rows += [{'id': k, 'public_id': f'bench-{k}', 'username': f'bench-user-{k - 1}', 'password': password, 'admin': False}
+             for k in range(2, users + 1)]
+    rows += [{'id': users + 1 + k, 'public_id': f'doomed-{k}', 'username': f'doomed-{k}', 'password': password,
+              'admin': False} for k in range(doomed)]
+    db.session.execute(User.__table__.insert(), rows)
+
+    # Payments of the seeded users (half by bank slip, half by credit card) and the ones to be deleted...
+    for start in range(0, payments + doomed, 10000):
+        rows = []
+
+        for k in range(start, min(start + 10000, payments + doomed)):
+            card = k % 2 == 1
+
+            rows.append({'user_id': (k % users) + 1, 'name': f'Client {k}', 'email': f'client{k}@mail.com',
+                         'cpf': f'{k:011d}', 'amount': k % 100000, 'payment_method': k % 2,
+                         'name_card': f'CLIENT {k}' if card else None, 'num_card': f'{k:016d}' if card else None,
+                         'expiration': '04/30' if card else None, 'cvv': k % 1000 if card else None})
+
+        db.session.execute(Payment.__table__.insert(), rows)
+
+    db.session.commit()
+    rebuild_payment_stats()
+    db.session.remove()
+
+
+# ------------- #
+#  THE ROUTES   #
+# ============= #
+
+def basic_auth(username, password):
+    return 'Basic ' + base64.b64encode(f'{username}:{password}'.encode()).decode()
+
+
+def routes(users, payments, tokens):
+
+    """
+    The routes to be benchmarked. Each route is a tuple (name, status, request), where 'status' is the status
+    expected in every response and 'request' is a function that returns the (method, path, headers, body) of
+    the next request.
+
+    :param users: Number of seeded users.
+    :param payments: Number of seeded payments.
+    :param tokens: Tokens of the admin and of the regular user.
+    :return: List of routes.
+    """
+
+    admin = {'X-Access-Token': tokens['admin'], 'Content-Type': 'application/json'}
+    regular = {'X-Access-Token': tokens['regular'], 'Content-Type': 'application/json'}
+
+    boleto = {'name': 'Edward Newgate', 'email': 'shirohige@gmail.com', 'cpf': '01203412755',
+              'amount': 50550, 'payment_method': 0}
+    bulk = json.dumps([boleto] * 100)
+
+    # Users and payments deleted by the benchmark are taken one by one from the extra ones seeded...
+    doomed_users = itertools.count()
+    doomed_payments = itertools.count(payments + 1)
+    created_users = itertools.count()
+    seeded_users = itertools.count()
+
+    def seeded_user():
+        # Skips the admin and the regular user of the benchmark (users 1 and 2), which must not be promoted...
+        return f'bench-{next(seeded_users) % (users - 2) + 3}'
+
+    return [
+        ('home', 200, lambda: ('GET', '/home', {}, None)),
+        ('login', 200, lambda: ('GET', '/login', {'Authorization': basic_auth(*REGULAR)}, None)),
+        ('get_all_users', 200, lambda: ('GET', '/user', admin, None)),
+        ('get_one_user', 200, lambda: ('GET', f'/user/{seeded_user()}', admin, None)),
+        ('create_user', 200, lambda: ('POST', '/user', admin,
+                                      json.dumps({'username': f'created-{next(created_users)}', 'password': 'x'}))),
+        ('promote_user', 200, lambda: ('PUT', f'/user/{seeded_user()}', admin, None)),
+        ('delete_user', 200, lambda: ('DELETE', f'/user/doomed-{next(doomed_users)}', admin, None)),
+        ('get_all_payments (user)', 200, lambda: ('GET', '/payment', regular, None)),
+        ('get_all_payments (admin)', 200, lambda: ('GET', '/payment', admin, None)),
+        ('get_all_payments (admin, page)', 200, lambda: ('GET', '/payment?limit=100', admin, None)),
+        ('get_all_payments (admin, stream)', 200, lambda: ('GET', '/payment?stream=1', admin, None)),
+        ('get_all_payments (admin, ndjson)', 200, lambda: ('GET', '/payment?format=ndjson', admin, None)),
+        ('get_all_payments (admin, csv)', 200, lambda: ('GET', '/payment?format=csv', admin, None)),
+        ('get_all_payments (admin, cpf)', 200, lambda: ('GET', f'/payment?cpf={next(seeded_users) % payments:011d}', admin, None)),
+        ('get_all_payments (admin, sort=-amount)', 200, lambda: ('GET', '/payment?sort=-amount&limit=100', admin, None)),
+        ('get_all_payments (user, archive)', 200, lambda: ('GET', '/payment?archive=1&limit=100', regular, None)),
+        ('get_payment_stats', 200, lambda: ('GET', '/payment/stats?bucket=day', admin, None)),
+        ('get_one_payment', 200, lambda: ('GET', f'/payment/{next(seeded_users) % payments + 1}', admin, None)),
+        ('make_a_payment', 200, lambda: ('POST', '/payment', regular, json.dumps(boleto))),
+        ('make_bulk_payments', 200, lambda: ('POST', '/payment/bulk', regular, bulk)),
+        ('delete_payment', 200, lambda: ('DELETE', f'/payment/{next(doomed_payments)}', admin, None)),
+    ]
+
+
+# ------------- #
+#    DRIVERS    #
+# ============= #
+
+class ClientDriver:
+
+    """
+    Sends the requests through the Flask test client (no network, one client per thread).
+    """
+
+    name = 'client'
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def __call__(self, method, path, headers, body):
+        if not hasattr(self._local, 'client'):
+            self._local.client = app.test_client()
+
+        response = self._local.client.open(path, method=method, headers=headers, data=body)
+        response.get_data()
+
+        return response.status_code
+
+    def close(self):
+        pass
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+
+    """
+    Request handler that doesn't log each request and disables Nagle's algorithm, otherwise small
+    responses wait for the delayed ACK of the client (~40 ms) and the latencies become meaningless.
+    """
+
+    disable_nagle_algorithm = True
+
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class ServerDriver:
+
+    """
+    Sends the requests through HTTP to a local threaded WSGI server (one keep-alive connection per thread).
+    """
+
+    name = 'server'
+
+    def __init__(self):
+        self._server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietRequestHandler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        self._local = threading.local()
+
+    def __call__(self, method, path, headers, body):
+        if not hasattr(self._local, 'connection'):
+            self._local.connection = http.client.HTTPConnection('127.0.0.1', self._server.server_port)
+
+        try:
+            self._local.connection.request(method, path, body=body, headers=headers)
+            response = self._local.connection.getresponse()
+            response.read()
+
+        except (http.client.HTTPException, ConnectionError):
+            # The server closed the connection, opens a new one for the next request...
+
+            del self._local.connection
+            return 599
+
+        return response.status
+
+    def close(self):
+        self._server.shutdown()
+
+
+# -------------- #
+#  MEASUREMENTS  #
+# ============== #
+
+def percentile(values, p):
+    """:return: The 'p' percentile of the sorted list 'values'."""
+
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def peak_rss_mb():
+    """:return: Peak resident memory of the process, in MiB."""
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Linux reports it in KiB, macOS in bytes...
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_route(driver, make_request, expected, requests, concurrency):
+
+    """
+    Sends 'requests' requests to a route with 'concurrency' threads. Any response with another status than
+    'expected' is an error (a 4xx, like a 429 of the limiters, is as wrong as a 5xx for the measurements).
+
+    :return: Dictionary with the latencies (ms), throughput (requests/s), errors and peak RSS (MiB).
+    """
+
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def worker(count):
+        nonlocal errors
+        local = []
+        local_errors = 0
+
+        for _ in range(count):
+            method, path, headers, body = make_request()
+
+            start = time.perf_counter()
+            status = driver(method, path, headers, body)
+            local.append((time.perf_counter() - start) * 1000)
+
+            if status != expected:
+                local_errors += 1
+
+        with lock:
+            latencies.extend(local)
+            errors += local_errors
+
+    # Splits the requests between the threads...
+    counts = [requests // concurrency + (1 if k < requests % concurrency else 0) for k in range(concurrency)]
+
+    start = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(worker, counts))
+
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+
+    return {'p50': percentile(latencies, 50), 'p95': percentile(latencies, 95), 'p99': percentile(latencies, 99),
+            'throughput': requests / elapsed, 'errors': errors, 'rss': peak_rss_mb()}
+
+
+def token_benchmarks(iterations):
+
+    """
+    Microbenchmarks of the token modes: issuing and verifying tokens with PyJWT (as the API did before the
+    token service), with the token service (JWT with 'SECRET_KEY', JWT with rotated keys) and with opaque
+    session tokens, indexed in memory and in a SQLite file.
+
+    :param iterations: Number of tokens issued and verified by each mode.
+    """
+
+    secret = 'bench-secret'
+    keys = parse_token_keys('bench-2:new-secret,bench-1:old-secret')
+
+    def pyjwt_issue(public_id):
+        return jwt.encode({'public_id': public_id, 'exp': datetime.datetime.utcnow() + datetime.timedelta(minutes=15)},
+                          secret, algorithm='HS256')
+
+    def pyjwt_verify(token):
+        return jwt.decode(token, secret, algorithms=['HS256'])
+
+    services = [
+        ('jwt', TokenService(secret, {}, 900)),
+        ('jwt (kid)', TokenService(secret, keys, 900)),
+        ('session (memory)', TokenService(secret, {}, 900, 'session', MemorySessions())),
+        ('session (sqlite)', TokenService(secret, {}, 900, 'session',
+                                          SQLiteSessions(os.path.join(BENCH_DIR, 'sessions.db')))),
+    ]
+    modes = [('pyjwt (before)', pyjwt_issue, pyjwt_verify)]
+    modes += [(name, service.issue, service.verify) for name, service in services]
+
+    print(f"\n{'token mode':<24} {'issue us':>10} {'verify us':>10} {'verify/s':>10} {'length':>7}")
+
+    for name, issue, verify in modes:
+        start = time.perf_counter()
+        tokens = [issue(f'bench-{k}') for k in range(iterations)]
+        issued = time.perf_counter() - start
+
+        start = time.perf_counter()
+
+        for token in tokens:
+            verify(token)
+
+        verified = time.perf_counter() - start
+
+        print(f"{name:<24} {issued / iterations * 1e6:10.2f} {verified / iterations * 1e6:10.2f} "
+              f"{iterations / verified:10.0f} {len(tokens[0]):7d}")
+
+
+def compare(results, baseline, tolerance):
+
+    """
+    Compares the results with the baseline. A route regresses if its p95 latency got higher or its throughput
+    got lower than the baseline by more than 'tolerance' (fraction).
+
+    :return: List of the keys of the routes that regressed.
+    """
+
+    regressions = []
+
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+
+        base = baseline[key]
+        p95_change = (result['p95'] - base['p95']) / base['p95'] if base['p95'] else 0
+        throughput_change = (result['throughput'] - base['throughput']) / base['throughput'] if base['throughput'] else 0
+
+        regressed = p95_change > tolerance or throughput_change < -tolerance
+        flag = '  <-- REGRESSION' if regressed else ''
+
+        print(f"{key:<58} p95 {p95_change:+7.1%}   throughput {throughput_change:+7.1%}{flag}")
+
+        if regressed:
+            regressions.append(key)
+
+    return regressions
+
+
+# ------------- #
+#     MAIN      #
+# ============= #
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark and load test of the routes of the payments API.')
+    parser.add_argument('--users', type=int, default=100, help='number of seeded users (default: 100)')
+    parser.add_argument('--payments', type=int, default=10000, help='number of seeded payments (default: 10000)')
+    parser.add_argument('--requests', type=int, default=200, help='requests per route and concurrency level (default: 200)')
+    parser.add_argument('--concurrency', default='1,8', help='comma separated concurrency levels (default: 1,8)')
+    parser.add_argument('--driver', choices=['client', 'server', 'both'], default='both',
+                        help='Flask test client, local WSGI server or both (default: both)')
+    parser.add_argument('--routes', help='comma separated names (or the start of the names) of the routes to run (default: all)')
+    parser.add_argument('--baseline', help='JSON file with the baseline to compare against')
+    parser.add_argument('--save-baseline', help='save the results as a baseline in this JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='allowed regression (default: 0.10 = 10%%)')
+    parser.add_argument('--check', action='store_true',
+                        help='exit with an error if any route regressed or returned an unexpected status')
+    parser.add_argument('--tokens', type=int, metavar='N',
+                        help='only run the microbenchmarks of the token modes, with N tokens each')
+    args = parser.parse_args(argv)
+
+    if args.tokens:
+        token_benchmarks(args.tokens)
+        return 0
+
+    if args.users < 3 or args.payments < 1:
+        parser.error('at least 3 users and 1 payment are needed')
+
+    levels = [int(level) for level in args.concurrency.split(',')]
+    drivers = ['client', 'server'] if args.driver == 'both' else [args.driver]
+
+    # Enough extra users and payments for every run of the delete routes...
+    doomed = args.requests * len(levels) * len(drivers)
+
+    print(f"Seeding {args.users} users and {args.payments} payments in {BENCH_DIR}...")
+
+    with app.app_context():
+        seed(args.users, args.payments, doomed)
+
+    client = app.test_client()
+    tokens = {'admin': client.get('/login', headers={'Authorization': basic_auth(*ADMIN)}).get_json()['token'],
+              'regular': client.get('/login', headers={'Authorization': basic_auth(*REGULAR)}).get_json()['token']}
+
+    selected = args.routes.split(',') if args.routes else None
+    route_list = [route for route in routes(args.users, args.payments, tokens)
+                  if not selected or route[0].startswith(tuple(selected))]
+
+    results = {}
+
+    print(f"\n{'route':<58} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'req/s':>9} {'errors':>6} {'RSS MiB':>8}")
+
+    for driver_name in drivers:
+        driver = ClientDriver() if driver_name == 'client' else ServerDriver()
+
+        for concurrency in levels:
+            for name, expected, make_request in route_list:
+                key = f"{driver_name} c={concurrency} {name}"
+                result = run_route(driver, make_request, expected, args.requests, concurrency)
+                results[key] = result
+
+                print(f"{key:<58} {result['p50']:8.2f} {result['p95']:8.2f} {result['p99']:8.2f} "
+                      f"{result['throughput']:9.1f} {result['errors']:6d} {result['rss']:8.1f}")
+
+        driver.close()
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+
+        print(f"\nBaseline saved in {args.save_baseline}")
+
+    failed = [key for key, result in results.items() if result['errors']]
+    regressions = []
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+        print(f"\nComparison with {args.baseline}:")
+        regressions = compare(results, baseline, args.tolerance)
+
+    if failed:
+        # The measurements of a route with unexpected responses aren't comparable...
+
+        print(f"\n{len(failed)} route(s) returned unexpected statuses: {', '.join(failed)}")
+
+    if regressions:
+        print(f"\n{len(regressions)} route(s) regressed more than {args.tolerance:.0%}")
+
+    return 1 if args.check and (failed or regressions) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,50 @@
+# Configuration of the production server (gunicorn). Run it in the folder 'app':
+#
+#     gunicorn -c gunicorn.conf.py app:app
+#
+# The master loads the app once and forks the workers. 'kill -HUP <master>' starts new workers and stops the
+# old ones after they finish their requests. As the app is preloaded, a new version of the code is loaded
+# with 'kill -USR2 <master>' (starts a new master) followed by 'kill -QUIT <old master>'...
+
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', f"0.0.0.0:{os.environ.get('PORT', 5000)}")
+
+# One worker per core (plus one), each one with 'WEB_THREADS' threads...
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() + 1))
+threads = int(os.environ.get('WEB_THREADS', 1))
+worker_class = 'gthread' if threads > 1 else 'sync'
+
+# Imports the app in the master, before forking, so the workers share its memory and start faster...
+preload_app = os.environ.get('PRELOAD_APP', '1') == '1'
+
+timeout = 30
+graceful_timeout = 30 # Time to finish the requests in progress when the worker is stopped or reloaded
+keepalive = 5
+
+# Replaces the workers from time to time (not all at once), so a leak can't grow forever...
+max_requests = int(os.environ.get('MAX_REQUESTS', 10000))
+max_requests_jitter = max_requests // 10
+
+accesslog = os.environ.get('ACCESS_LOG')
+
+
+def post_fork(server, worker):
+    from app import app, after_fork
+
+    after_fork(app)
+
+
+def post_worker_init(worker):
+    from app import app, warm_up
+
+    warm_up(app)
+    worker.log.info('Worker %s warmed up', worker.pid)
+
+
+def worker_exit(server, worker):
+    from app import app, db
+
+    with app.app_context():
+        db.engine.dispose()
@@ -0,0 +1,69 @@
+# Tests of the payments API. Each test gets its own app, with an in memory database, and
+# the users 'admin' (an admin) and 'edward' (a regular user).
+#
+# Usage (in the root folder of the project):
+#   python3 -m pytest -q
+
+import base64
+import os
+import sys
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app'))
+
+from app import create_app, db, User  # noqa: E402
+
+USERS = {'admin': ('1234', True), 'edward': ('newgate', False)}
+
+
+def basic_auth(username, password):
+    return 'Basic ' + base64.b64encode(f'{username}:{password}'.encode()).decode()
+
+
+@pytest.fixture
+def config():
+    """Config of the app of the test, a test can change it before using 'app'."""
+
+    return {'SQLALCHEMY_DATABASE_URI': 'sqlite://', 'SECRET_KEY': 'test-secret', 'RATE_LIMIT_ENABLED': False,
+            'USER_PURGE_IN_BACKGROUND': False, 'PAYMENT_WORKERS': 0}
+
+
+@pytest.fixture
+def app(config):
+    app = create_app(config)
+
+    with app.app_context():
+        # The old 'sha256' hashes are cheap, so the logins of the tests are fast...
+
+        for username, (password, admin) in USERS.items():
+            db.session.add(User(public_id=username, username=username, admin=admin,
+                                password=generate_password_hash(password, method='sha256')))
+
+        db.session.commit()
+
+        yield app
+
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def login(client):
+
+    """
+    :return: Function that logs in an user of 'USERS' and returns the headers with their token.
+    """
+
+    def login(username):
+        response = client.get('/login', headers={'Authorization': basic_auth(username, USERS[username][0])})
+        assert response.status_code == 200
+
+        return {'X-Access-Token': response.get_json()['token']}
+
+    return login
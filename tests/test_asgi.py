@@ -0,0 +1,253 @@
+# The native routes of the ASGI server ('asgi.py') must give the same responses as the routes of the
+# Flask app. Each request is sent to both, through the ASGI app and through the Flask test client, on
+# the same database.
+
+import asyncio
+import base64
+import importlib
+import json
+import sys
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+pytest.importorskip('starlette')
+pytest.importorskip('aiosqlite')
+
+from app import db, Config, Payment, User  # noqa: E402
+
+USERS = {'admin': ('1234', True), 'edward': ('newgate', False)}
+
+# (user_id, amount, payment_method), one of them without amount...
+PAYMENTS = [(2, 50550, 0), (2, 12400000, 1), (1, 100, 0), (2, None, 0), (2, 100, 1)]
+
+BOLETO = {'name': 'Edward Newgate', 'email': 'shirohige@gmail.com', 'cpf': '01203412755', 'amount': 50550,
+          'payment_method': 0}
+
+
+class Response:
+
+    """
+    Response of the ASGI app, with the attributes of the Flask test client's responses used by the tests.
+    """
+
+    def __init__(self, status_code, headers, body):
+        self.status_code = status_code
+        self.headers = headers
+        self.body = body
+
+    def get_json(self):
+        return json.loads(self.body) if self.headers.get('content-type') == 'application/json' else None
+
+
+class ASGIClient:
+
+    """
+    Sends requests to an ASGI app, all in the same event loop (the async engine is bound to it).
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.loop = asyncio.new_event_loop()
+
+    def open(self, method, path, headers=None, json_body=None):
+        return self.loop.run_until_complete(self.request(method, path, dict(headers or {}), json_body))
+
+    def get(self, path, headers=None):
+        return self.open('GET', path, headers)
+
+    def post(self, path, json=None, headers=None):
+        return self.open('POST', path, headers, json)
+
+    async def request(self, method, path, headers, json_body):
+        path, _, query = path.partition('?')
+        body = b'' if json_body is None else json.dumps(json_body).encode()
+
+        if body:
+            headers['Content-Type'] = 'application/json'
+
+        scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method,
+                 'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+                 'root_path': '', 'client': ('127.0.0.1', 50000), 'server': ('localhost', 80),
+                 'headers': [(name.lower().encode(), value.encode()) for name, value in headers.items()]}
+        requests = [{'type': 'http.request', 'body': body, 'more_body': False}]
+        disconnected = asyncio.Event()
+        status, response_headers, chunks = None, {}, []
+
+        async def receive():
+            if requests:
+                return requests.pop(0)
+
+            # The client stays connected until the response is sent...
+            await disconnected.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            nonlocal status
+
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                response_headers.update((name.decode().lower(), value.decode()) for name, value in message['headers'])
+            elif message['type'] == 'http.response.body':
+                chunks.append(message.get('body', b''))
+
+        await self.app(scope, receive, send)
+        disconnected.set()
+
+        return Response(status, response_headers, b''.join(chunks))
+
+    def close(self):
+        self.loop.close()
+
+
+@pytest.fixture(scope='module')
+def asgi(tmp_path_factory):
+
+    """
+    The module 'asgi', imported with a database of its own (its app is created when it's imported).
+    """
+
+    database = tmp_path_factory.mktemp('asgi') / 'payments.db'
+    config = {'SQLALCHEMY_DATABASE_URI': f'sqlite:///{database}', 'SECRET_KEY': 'test-secret',
+              'RATE_LIMIT_ENABLED': False, 'RATE_LIMIT_STORAGE': 'memory', 'SESSION_STORAGE': 'memory',
+              'USER_PURGE_IN_BACKGROUND': False, 'PAYMENT_WORKERS': 0}
+
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        for name, value in config.items():
+            monkeypatch.setattr(Config, name, value)
+
+        sys.modules.pop('asgi', None)
+        module = importlib.import_module('asgi')
+
+    with module.flask_app.app_context():
+        db.create_all()
+
+        for username, (password, admin) in USERS.items():
+            db.session.add(User(public_id=username, username=username, admin=admin,
+                                password=generate_password_hash(password, method='sha256')))
+
+        for user_id, amount, payment_method in PAYMENTS:
+            db.session.add(Payment(user_id=user_id, name='x', email='x@gmail.com', cpf='01203412755', amount=amount,
+                                   payment_method=payment_method))
+
+        db.session.commit()
+
+    yield module
+
+    sys.modules.pop('asgi', None)
+
+
+@pytest.fixture(scope='module')
+def clients(asgi):
+
+    """
+    :return: Client of the ASGI app and client of the Flask app.
+    """
+
+    native = ASGIClient(asgi.app)
+
+    yield native, asgi.flask_app.test_client()
+
+    native.loop.run_until_complete(asgi.engine.dispose())
+    native.close()
+
+
+@pytest.fixture(scope='module')
+def tokens(clients):
+    _, client = clients
+    tokens = {}
+
+    for username, (password, _) in USERS.items():
+        authorization = 'Basic ' + base64.b64encode(f'{username}:{password}'.encode()).decode()
+        tokens[username] = {'X-Access-Token': client.get('/login', headers={'Authorization': authorization}).get_json()['token']}
+
+    return tokens
+
+
+def assert_same(native, flask):
+    assert native.status_code == flask.status_code
+    assert native.headers.get('content-type') == flask.headers.get('Content-Type')
+    assert native.headers.get('etag') == flask.headers.get('ETag')
+
+    if flask.is_json:
+        assert native.get_json() == flask.get_json()
+    else:
+        assert native.body == flask.get_data()
+
+
+def test_home(clients):
+    native, client = clients
+
+    assert native.get('/home').body == client.get('/home').get_data()
+
+
+@pytest.mark.parametrize('username', list(USERS))
+@pytest.mark.parametrize('query', [
+    '', 'limit=2', 'limit=2&after=1', 'sort=-payment_id', 'sort=amount', 'sort=-amount&limit=2',
+    'sort=amount&limit=2&after=null,4', 'sort=-amount&after=100,3', 'payment_method=boleto',
+    'payment_method=credit card', 'min_amount=100&max_amount=60000', 'email=x@gmail.com', 'cpf=01203412755',
+    'user_id=2', 'limit=abc', 'limit=0', 'sort=name', 'sort=amount&after=1', 'after=abc', 'min_amount=x',
+    'payment_method=3',
+])
+def test_list_payments(clients, tokens, username, query):
+    native, client = clients
+    path = f'/payment?{query}'
+
+    assert_same(native.get(path, headers=tokens[username]), client.get(path, headers=tokens[username]))
+
+
+@pytest.mark.parametrize('username', list(USERS))
+@pytest.mark.parametrize('payment_id', ['1', '3', '4', '999', 'abc'])
+def test_get_one_payment(clients, tokens, username, payment_id):
+    native, client = clients
+    path = f'/payment/{payment_id}'
+
+    assert_same(native.get(path, headers=tokens[username]), client.get(path, headers=tokens[username]))
+
+
+@pytest.mark.parametrize('path', ['/payment', '/payment?limit=2', '/payment/1'])
+def test_not_modified(clients, tokens, path):
+    native, client = clients
+    etag = client.get(path, headers=tokens['edward']).headers['ETag']
+    headers = {**tokens['edward'], 'If-None-Match': etag}
+
+    response = native.get(path, headers=headers)
+
+    assert response.status_code == client.get(path, headers=headers).status_code == 304
+    assert response.headers['etag'] == etag
+
+
+@pytest.mark.parametrize('path', ['/payment', '/payment/1'])
+@pytest.mark.parametrize('headers', [{}, {'X-Access-Token': 'abc'}])
+def test_invalid_token(clients, path, headers):
+    native, client = clients
+
+    assert_same(native.get(path, headers=headers), client.get(path, headers=headers))
+
+
+@pytest.mark.parametrize('data', [
+    dict(BOLETO, amount='100'), dict(BOLETO, amount=True), dict(BOLETO, payment_method=5),
+    {key: value for key, value in BOLETO.items() if key != 'cpf'}, dict(BOLETO, payment_method=1), None,
+])
+def test_invalid_payment(clients, tokens, data):
+    native, client = clients
+
+    assert_same(native.post('/payment', json=data, headers=tokens['edward']),
+                client.post('/payment', json=data, headers=tokens['edward']))
+
+
+def test_make_a_payment(clients, tokens):
+    native, client = clients
+    response = native.post('/payment', json=BOLETO, headers=tokens['edward'])
+    flask_response = client.post('/payment', json=BOLETO, headers=tokens['edward'])
+
+    # The number of the bank slip is random...
+    assert response.status_code == flask_response.status_code == 200
+    assert response.get_json().keys() == flask_response.get_json().keys() == {'ticket'}
+
+    # Both payments are listed the same way by both apps...
+    payments = client.get('/payment?sort=-payment_id&limit=2', headers=tokens['edward']).get_json()['payments']
+
+    assert [(payment['amount'], payment['payment_method']) for payment in payments] == [(50550, 'boleto')] * 2
+    assert_same(native.get('/payment?sort=-payment_id&limit=2', headers=tokens['edward']),
+                client.get('/payment?sort=-payment_id&limit=2', headers=tokens['edward']))
@@ -0,0 +1,12 @@
+import benchmark
+
+
+def test_unexpected_statuses_are_errors():
+    statuses = iter([200, 429, 200, 404])
+
+    def driver(method, path, headers, body):
+        return next(statuses)
+
+    result = benchmark.run_route(driver, lambda: ('GET', '/home', {}, None), 200, 4, 1)
+
+    assert result['errors'] == 2
@@ -0,0 +1,66 @@
+from app import db, Payment, PaymentStats
+
+BOLETO = {'name': 'Edward Newgate', 'email': 'shirohige@gmail.com', 'cpf': '01203412755', 'amount': 50550,
+          'payment_method': 0}
+
+
+def test_results_of_each_payment(client, login):
+    payments = [BOLETO, {'payment_method': 0}, 'not a payment', dict(BOLETO, payment_method=7), BOLETO]
+    response = client.post('/payment/bulk', json=payments, headers=login('edward'))
+
+    assert response.status_code == 200
+    assert response.get_json()['created'] == 2
+
+    results = response.get_json()['results']
+
+    assert [(result['index'], result['status']) for result in results] == [(0, 200), (1, 400), (2, 400), (3, 400), (4, 200)]
+    assert 'ticket' in results[0]
+    assert results[1]['message'] == "Missing field 'amount'!"
+    assert results[2]['message'] == 'Invalid payment!'
+    assert results[3]['message'] == 'Invalid payment method!'
+    assert Payment.query.count() == 2
+
+
+def test_ndjson_lines(client, login):
+    headers = dict(login('edward'), **{'Content-Type': 'application/x-ndjson'})
+    body = '{"name": "x", "email": "x", "cpf": "1", "amount": 10, "payment_method": 0}\n\nnot json\n'
+
+    response = client.post('/payment/bulk', data=body, headers=headers)
+
+    assert response.get_json()['created'] == 1
+    assert [result['status'] for result in response.get_json()['results']] == [200, 400]
+
+
+def test_payments_are_inserted_in_chunks(app, client, login, monkeypatch):
+    app.config['PAYMENT_BULK_CHUNK_SIZE'] = 2
+    chunks = []
+    bulk_save_objects = db.session.bulk_save_objects
+
+    def count_chunks(objects, *args, **kwargs):
+        chunks.append(len(objects))
+        return bulk_save_objects(objects, *args, **kwargs)
+
+    monkeypatch.setattr(db.session, 'bulk_save_objects', count_chunks, raising=False)
+
+    response = client.post('/payment/bulk', json=[BOLETO] * 5, headers=login('edward'))
+
+    assert response.get_json()['created'] == 5
+    assert chunks == [2, 2, 1]
+    assert Payment.query.count() == 5
+    assert sum(stats.count for stats in PaymentStats.query.all()) == 5
+
+
+def test_too_many_payments(app, client, login):
+    app.config['PAYMENT_BULK_MAX_ITEMS'] = 3
+
+    response = client.post('/payment/bulk', json=[BOLETO] * 4, headers=login('edward'))
+
+    assert response.status_code == 413
+    assert response.get_json() == {'message': 'Too many payments! The maximum is 3.'}
+    assert Payment.query.count() == 0
+
+
+def test_not_a_list(client, login):
+    response = client.post('/payment/bulk', json=BOLETO, headers=login('edward'))
+
+    assert response.get_json() == {'results': [{'message': 'Invalid payment!', 'index': 0, 'status': 400}], 'created': 0}
@@ -0,0 +1,84 @@
+import pytest
+
+from app import CollectionVersion
+
+BOLETO = {'name': 'Edward Newgate', 'email': 'shirohige@gmail.com', 'cpf': '01203412755', 'amount': 50550,
+          'payment_method': 0}
+
+
+def versions():
+    return {row.name: row.version for row in CollectionVersion.query.all() if row.name.startswith('payments')}
+
+
+def users_version():
+    return CollectionVersion.query.get('users').version
+
+
+@pytest.mark.parametrize('path', ['/payment', '/payment/stats', '/payment?limit=10'])
+def test_not_modified(client, login, path):
+    headers = login('edward')
+    response = client.get(path, headers=headers)
+
+    assert response.status_code == 200
+    assert response.headers['ETag']
+    assert 'Accept' in response.headers['Vary']
+
+    again = client.get(path, headers=dict(headers, **{'If-None-Match': response.headers['ETag']}))
+
+    assert again.status_code == 304
+    assert again.headers['ETag'] == response.headers['ETag']
+    assert not again.get_data()
+
+
+def test_etag_depends_on_the_request(client, login):
+    edward, admin = login('edward'), login('admin')
+
+    etags = {client.get('/payment', headers=edward).headers['ETag'],
+             client.get('/payment?limit=10', headers=edward).headers['ETag'],
+             client.get('/payment', headers=dict(edward, Accept='application/json')).headers['ETag'],
+             client.get('/payment', headers=admin).headers['ETag']}
+
+    assert len(etags) == 4
+
+
+def test_payments_bump_the_versions(client, login):
+    edward, admin = login('edward'), login('admin')
+    etag = client.get('/payment', headers=edward).headers['ETag']
+    admin_etag = client.get('/payment', headers=admin).headers['ETag']
+
+    assert client.post('/payment', json=BOLETO, headers=edward).status_code == 200
+    assert versions() == {'payments': 1, 'payments:2': 1}
+
+    response = client.get('/payment', headers=dict(edward, **{'If-None-Match': etag}))
+
+    assert response.status_code == 200
+    assert len(response.get_json()['payments']) == 1
+    assert client.get('/payment', headers=dict(admin, **{'If-None-Match': admin_etag})).status_code == 200
+
+    client.post('/payment/bulk', json=[BOLETO, BOLETO], headers=edward)
+    client.delete('/payment/1', headers=edward)
+
+    assert versions() == {'payments': 3, 'payments:2': 3}
+
+
+def test_payments_of_another_user_dont_change_the_etag(client, login):
+    edward, admin = login('edward'), login('admin')
+    etag = client.get('/payment', headers=edward).headers['ETag']
+
+    assert client.post('/payment', json=BOLETO, headers=admin).status_code == 200
+    assert client.get('/payment', headers=dict(edward, **{'If-None-Match': etag})).status_code == 304
+
+
+def test_users_bump_their_version(client, login):
+    admin = login('admin')
+    etag = client.get('/user', headers=admin).headers['ETag']
+    version = users_version()
+
+    assert client.post('/user', json={'username': 'luffy', 'password': 'x'}, headers=admin).status_code == 200
+    assert users_version() == version + 1
+    assert client.get('/user', headers=dict(admin, **{'If-None-Match': etag})).status_code == 200
+
+    client.put('/user/edward', headers=admin)
+    client.delete('/user/edward', headers=admin)
+
+    assert users_version() == version + 3
@@ -0,0 +1,127 @@
+import csv
+import io
+import json
+
+import pytest
+
+from app import db, Payment, EXPORT_FIELDS
+
+ROWS = [(1, 2, 'Edward Newgate', 'shirohige@gmail.com', '01203412755', 50550, 'boleto', None, None, None, None),
+        (2, 2, 'Edward Newgate', 'shirohige@gmail.com', '01203412755', 12400000, 'credit card', 'EDWARD NEWGATE',
+         '1112333544467778', '04/25', 700),
+        (3, 1, 'Gol D. Roger', 'roger@gmail.com', '98765432100', 100, 'boleto', None, None, None, None)]
+
+
+@pytest.fixture
+def payments(app):
+    # Batches of 2 rows, so the exports have more than one batch...
+
+    app.config['PAYMENT_STREAM_BATCH_SIZE'] = 2
+
+    for row in ROWS:
+        fields = dict(zip(EXPORT_FIELDS, row))
+        fields['id'] = fields.pop('payment_id')
+        fields['payment_method'] = 0 if fields['payment_method'] == 'boleto' else 1
+        db.session.add(Payment(**fields))
+
+    db.session.commit()
+
+
+def export(client, headers, query, mimetype):
+    response = client.get(f'/payment?{query}', headers=headers)
+
+    assert response.status_code == 200
+    assert response.mimetype == mimetype
+    assert response.is_streamed
+
+    return response.get_data()
+
+
+def test_ndjson(client, login, payments):
+    data = export(client, login('admin'), 'format=ndjson', 'application/x-ndjson')
+
+    assert data.endswith(b'\n')
+    assert [json.loads(line) for line in data.splitlines()] == [dict(zip(EXPORT_FIELDS, row)) for row in ROWS]
+
+
+def test_ndjson_of_a_regular_user(client, login, payments):
+    data = export(client, login('edward'), 'format=ndjson', 'application/x-ndjson')
+
+    assert [json.loads(line)['payment_id'] for line in data.splitlines()] == [1, 2]
+
+
+def test_csv(client, login, payments):
+    data = export(client, login('admin'), 'format=csv', 'text/csv')
+    header, *rows = csv.reader(io.StringIO(data.decode()))
+
+    assert tuple(header) == EXPORT_FIELDS
+    assert rows == [['' if value is None else str(value) for value in row] for row in ROWS]
+
+
+def test_csv_without_payments(client, login):
+    data = export(client, login('admin'), 'format=csv', 'text/csv')
+
+    assert list(csv.reader(io.StringIO(data.decode()))) == [list(EXPORT_FIELDS)]
+
+
+def test_export_by_accept_header(client, login, payments):
+    response = client.get('/payment?sort=-amount', headers={**login('admin'), 'Accept': 'text/csv'})
+
+    assert response.mimetype == 'text/csv'
+    assert [row[0] for row in csv.reader(io.StringIO(response.get_data(as_text=True)))][1:] == ['2', '1', '3']
+
+
+def test_export_after_cursor(client, login, payments):
+    data = export(client, login('admin'), 'format=ndjson&after=1', 'application/x-ndjson')
+
+    assert [json.loads(line)['payment_id'] for line in data.splitlines()] == [2, 3]
+
+
+def test_arrow(client, login, payments):
+    pyarrow = pytest.importorskip('pyarrow')
+
+    data = export(client, login('admin'), 'format=arrow', 'application/vnd.apache.arrow.stream')
+    table = pyarrow.ipc.open_stream(data).read_all()
+
+    assert tuple(table.column_names) == EXPORT_FIELDS
+    assert [tuple(row.values()) for row in table.to_pylist()] == ROWS
+
+
+def test_msgpack(client, login, payments):
+    msgpack = pytest.importorskip('msgpack')
+
+    data = export(client, login('admin'), 'format=msgpack', 'application/msgpack')
+    header, *rows = msgpack.Unpacker(io.BytesIO(data), use_list=False)
+
+    assert header == EXPORT_FIELDS
+    assert rows == ROWS
+
+
+def test_unknown_format(client, login):
+    response = client.get('/payment?format=xml', headers=login('admin'))
+
+    assert response.status_code == 406
+    assert 'csv' in response.get_json()['formats']
+
+
+@pytest.mark.parametrize('query', ['format=ndjson', 'format=csv', 'stream=1'])
+def test_open_stream_counts_for_the_user_concurrency(app, client, login, payments, query):
+    app.config['RATE_LIMIT_ENABLED'] = True
+    user_concurrency = app.extensions['payments']['user_concurrency']
+    user_concurrency.limit = 1
+    headers = login('admin')
+
+    # The first export isn't read yet, so it still holds the slot of the user...
+    stream = client.get(f'/payment?{query}', headers=headers, buffered=False)
+
+    assert stream.status_code == 200
+    assert client.get('/payment?format=csv', headers=headers).status_code == 429
+
+    stream.get_data()
+    stream.close()
+
+    response = client.get('/payment?format=csv', headers=headers)
+    response.close()
+
+    assert response.status_code == 200
+    assert user_concurrency._running == {}
@@ -0,0 +1,62 @@
+import threading
+
+from app import Payment
+
+BOLETO = {'name': 'Edward Newgate', 'email': 'shirohige@gmail.com', 'cpf': '01203412755', 'amount': 50550,
+          'payment_method': 0}
+
+
+def test_committer_survives_errors(app, client, login, monkeypatch):
+    app.config.update(PAYMENT_GROUP_COMMIT=True, PAYMENT_GROUP_COMMIT_TIMEOUT=2)
+    headers = login('edward')
+    committer = app.extensions['payments']['payment_committer']
+
+    # The notification of a request fails (e.g. its event loop was closed)...
+    def callback():
+        raise RuntimeError('Event loop is closed')
+
+    with app.app_context():
+        pending = committer.submit(Payment(user_id=2, amount=10, payment_method=0), callback)
+        assert pending.wait(2)
+
+    # ...and the commit of a batch fails outside of the commits of the payments...
+    def broken_commit(batch):
+        raise RuntimeError('Broken commit')
+
+    monkeypatch.setattr(committer, 'commit', broken_commit)
+
+    assert client.post('/payment', json=BOLETO, headers=headers).status_code == 500
+
+    # ...but the committer thread is still running...
+    monkeypatch.undo()
+
+    assert client.post('/payment', json=BOLETO, headers=headers).status_code == 200
+    assert Payment.query.count() == 2
+
+
+def test_payment_not_committed_in_time(app, client, login, monkeypatch):
+    app.config.update(PAYMENT_GROUP_COMMIT=True, PAYMENT_GROUP_COMMIT_TIMEOUT=0.2)
+    headers = login('edward')
+    committer = app.extensions['payments']['payment_committer']
+    started, release = threading.Event(), threading.Event()
+    commit = committer.commit
+
+    def slow_commit(batch):
+        started.set()
+        release.wait(5)
+        commit(batch)
+
+    monkeypatch.setattr(committer, 'commit', slow_commit)
+
+    # The first payment holds the committer thread, the second one isn't started in time and is cancelled...
+    first = threading.Thread(target=lambda: app.test_client().post('/payment', json=BOLETO, headers=headers))
+    first.start()
+    assert started.wait(5)
+
+    response = client.post('/payment', json=BOLETO, headers=headers)
+
+    release.set()
+    first.join(5)
+
+    assert response.status_code == 503
+    assert Payment.query.count() == 1
@@ -0,0 +1,43 @@
+import datetime
+import hashlib
+
+import pytest
+
+from app import db, IdempotencyKey, Payment
+
+BOLETO = {'name': 'Edward Newgate', 'email': 'shirohige@gmail.com', 'cpf': '01203412755', 'amount': 50550,
+          'payment_method': 0}
+
+
+def test_retry_gets_the_stored_response(client, login):
+    headers = dict(login('edward'), **{'Idempotency-Key': 'payment-1'})
+
+    response = client.post('/payment', json=BOLETO, headers=headers)
+    retry = client.post('/payment', json=BOLETO, headers=headers)
+
+    assert retry.status_code == response.status_code == 200
+    assert retry.get_json() == response.get_json()
+    assert Payment.query.count() == 1
+    assert client.post('/payment', json=dict(BOLETO, amount=1), headers=headers).status_code == 422
+
+
+def claim(seconds_ago):
+    # A key claimed by a request of edward (user 2) that never stored its response...
+    now = datetime.datetime.utcnow()
+    key = hashlib.sha256(b'2:/payment:payment-2').hexdigest()
+    request_hash = hashlib.sha256(b'{}').hexdigest()
+
+    db.session.add(IdempotencyKey(key=key, request_hash=request_hash, claimed_at=now - datetime.timedelta(seconds=seconds_ago),
+                                  expires_at=now + datetime.timedelta(days=1)))
+    db.session.commit()
+
+
+@pytest.mark.parametrize('seconds_ago, status', [(1, 409), (120, 200)])
+def test_stale_claim_is_taken_over(app, client, login, seconds_ago, status):
+    app.config['IDEMPOTENCY_LOCK_TIMEOUT'] = 60
+    claim(seconds_ago)
+
+    response = client.post('/payment', json=BOLETO, headers=dict(login('edward'), **{'Idempotency-Key': 'payment-2'}))
+
+    assert response.status_code == status
+    assert Payment.query.count() == (status == 200)
@@ -0,0 +1,148 @@
+import pytest
+
+import app as payments_api
+from app import PaymentCache
+
+BOLETO = {'name': 'Edward Newgate', 'email': 'shirohige@gmail.com', 'cpf': '01203412755', 'amount': 50550,
+          'payment_method': 0}
+
+
+def make_payment(client, headers):
+    assert client.post('/payment', json=BOLETO, headers=headers).status_code == 200
+
+    return client.get('/payment', headers=headers).get_json()['payments'][-1]['payment_id']
+
+
+def without_database(monkeypatch):
+
+    """
+    Makes the reads of the payments from the database fail, so only the cache can answer.
+    """
+
+    def payment_query(*args, **kwargs):
+        raise AssertionError('The payment was read from the database')
+
+    monkeypatch.setattr(payments_api, 'payment_query', payment_query)
+
+
+def test_cache_hit(app, client, login, monkeypatch):
+    headers = login('edward')
+    payment_id = make_payment(client, headers)
+    first = client.get(f'/payment/{payment_id}', headers=headers)
+
+    assert first.status_code == 200
+    assert app.extensions['payments']['payment_cache'].get(payment_id) is not None
+
+    without_database(monkeypatch)
+    second = client.get(f'/payment/{payment_id}', headers=headers)
+
+    assert second.status_code == 200
+    assert second.get_data() == first.get_data()
+    assert second.headers['ETag'] == first.headers['ETag']
+
+
+def test_cached_payment_not_modified(client, login, monkeypatch):
+    headers = login('edward')
+    payment_id = make_payment(client, headers)
+    etag = client.get(f'/payment/{payment_id}', headers=headers).headers['ETag']
+
+    without_database(monkeypatch)
+    response = client.get(f'/payment/{payment_id}', headers={**headers, 'If-None-Match': etag})
+
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+
+
+def test_owner_is_checked_on_a_hit(client, login, monkeypatch):
+    admin_headers, headers = login('admin'), login('edward')
+    payment_id = make_payment(client, admin_headers)
+
+    # The payment of the admin is cached by the admin's read, then read by another user...
+    assert client.get(f'/payment/{payment_id}', headers=admin_headers).status_code == 200
+
+    without_database(monkeypatch)
+    response = client.get(f'/payment/{payment_id}', headers=headers)
+
+    assert response.status_code == 404
+    assert response.get_json() == {'message': 'No payment found!'}
+
+
+def test_admin_reads_a_payment_cached_by_its_owner(client, login, monkeypatch):
+    headers = login('edward')
+    payment_id = make_payment(client, headers)
+    body = client.get(f'/payment/{payment_id}', headers=headers).get_data()
+
+    without_database(monkeypatch)
+
+    assert client.get(f'/payment/{payment_id}', headers=login('admin')).get_data() == body
+
+
+@pytest.mark.parametrize('deleted_by', ['edward', 'admin'])
+def test_deleted_payment_is_evicted(client, login, deleted_by):
+    headers = login('edward')
+    payment_id = make_payment(client, headers)
+
+    assert client.get(f'/payment/{payment_id}', headers=headers).status_code == 200
+    assert client.delete(f'/payment/{payment_id}', headers=login(deleted_by)).status_code == 200
+    assert client.get(f'/payment/{payment_id}', headers=headers).status_code == 404
+
+
+def test_payments_of_a_deleted_user_are_evicted(client, login):
+    headers, admin_headers = login('edward'), login('admin')
+    payment_ids = [make_payment(client, headers) for _ in range(2)]
+
+    for payment_id in payment_ids:
+        assert client.get(f'/payment/{payment_id}', headers=admin_headers).status_code == 200
+
+    assert client.delete('/user/edward', headers=admin_headers).status_code == 200
+
+    for payment_id in payment_ids:
+        assert client.get(f'/payment/{payment_id}', headers=admin_headers).status_code == 404
+
+
+def test_archived_payments_arent_cached(app, client, login):
+    headers = login('edward')
+    payment_id = make_payment(client, headers)
+
+    assert client.get(f'/payment/{payment_id}?archive=1', headers=headers).status_code == 200
+    assert app.extensions['payments']['payment_cache'].get(payment_id) is None
+
+
+def test_least_recently_used_is_evicted():
+    cache = PaymentCache(max_bytes=3 * (PaymentCache.ENTRY_OVERHEAD + 10), max_ttl=60)
+
+    for payment_id in (1, 2, 3):
+        cache.put(payment_id, 2, b'x' * 10)
+
+    cache.get(1)
+    cache.put(4, 2, b'x' * 10)
+
+    assert [payment_id for payment_id in (1, 2, 3, 4) if cache.get(payment_id)] == [1, 3, 4]
+    assert cache.size == 3 * (PaymentCache.ENTRY_OVERHEAD + 10)
+
+
+def test_expired_entries_arent_returned():
+    cache = PaymentCache(max_bytes=1024, max_ttl=0)
+    cache.put(1, 2, b'{}')
+
+    assert cache.get(1) is None
+    assert cache.size == 0
+
+
+def test_disabled_cache():
+    cache = PaymentCache(max_bytes=0, max_ttl=60)
+    entry = cache.put(1, 2, b'{}')
+
+    assert entry.body == b'{}'
+    assert cache.get(1) is None
+
+
+def test_evict_user():
+    cache = PaymentCache(max_bytes=4096, max_ttl=60)
+
+    for payment_id, user_id in ((1, 1), (2, 2), (3, 2)):
+        cache.put(payment_id, user_id, b'{}')
+
+    cache.evict_user(2)
+
+    assert [payment_id for payment_id in (1, 2, 3) if cache.get(payment_id)] == [1]
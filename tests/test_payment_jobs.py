@@ -0,0 +1,67 @@
+import datetime
+import json
+import time
+
+import app as payments_api
+from app import db, Payment, PaymentJob
+
+CARD = {'name': 'Edward Newgate', 'email': 'shirohige@gmail.com', 'cpf': '01203412755', 'amount': 12400000,
+        'payment_method': 1, 'name_card': 'EDWARD NEWGATE', 'num_card': '1112333544467778', 'expiration': '04/25',
+        'cvv': 700}
+
+
+def test_reclaimed_job_is_finished_once(app, client, login, monkeypatch):
+    app.config.update(PAYMENT_PROCESSING='async', PAYMENT_JOB_TIMEOUT=-1)
+
+    response = client.post('/payment', json=CARD, headers=login('edward'))
+    assert response.status_code == 202
+
+    reclaimed = []
+
+    def authorize_card(payment):
+        # The first worker takes too long: while it authorizes the card, the job is claimed again by
+        # another worker, which finishes it...
+
+        if not reclaimed:
+            reclaimed.append(True)
+            assert payments_api.process_payment_jobs(10) == 1
+
+        return True
+
+    monkeypatch.setattr(payments_api, 'authorize_card', authorize_card)
+
+    payments_api.process_payment_jobs(10)
+
+    job = db.session.get(PaymentJob, response.get_json()['job_id'])
+
+    assert job.status == 'approved'
+    assert Payment.query.count() == 1
+    assert job.payment_id == Payment.query.one().id
+
+
+def test_pending_job_is_processed_when_the_worker_starts(app, monkeypatch):
+    # A job left in the queue by a restart, with no new payment to wake the workers up...
+
+    job = PaymentJob(user_id=2, data=json.dumps(CARD),
+                     status='pending', created_at=datetime.datetime.utcnow())
+
+    db.session.add(job)
+    db.session.commit()
+    job_id = job.id
+
+    monkeypatch.setattr(payments_api, 'authorize_card', lambda payment: True)
+    app.config.update(PAYMENT_PROCESSING='async', PAYMENT_WORKERS=1, PAYMENT_WORKER_POLL_INTERVAL=0.05)
+
+    payments_api.warm_up(app)
+
+    deadline = time.monotonic() + 5
+
+    while db.session.get(PaymentJob, job_id).status != 'approved' and time.monotonic() < deadline:
+        time.sleep(0.05)
+        db.session.remove()
+
+    # The worker thread outlives the test, this puts it to sleep after its next poll...
+    app.config['PAYMENT_WORKER_POLL_INTERVAL'] = 3600
+
+    assert db.session.get(PaymentJob, job_id).status == 'approved'
+    assert Payment.query.count() == 1
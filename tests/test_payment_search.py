@@ -0,0 +1,123 @@
+import pytest
+
+from app import db, Payment
+
+# (user_id, amount, payment_method, email, cpf), the payment_id is the position in the list + 1. Some
+# old payments have no amount...
+PAYMENTS = [(2, 300, 0, 'shirohige@gmail.com', '01203412755'), (2, None, 1, 'shirohige@gmail.com', '01203412755'),
+            (1, 100, 1, 'roger@gmail.com', '98765432100'), (2, 300, 1, 'marco@gmail.com', '01203412755'),
+            (1, None, 0, 'roger@gmail.com', '98765432100'), (2, 50, 0, 'shirohige@gmail.com', '11122233344'),
+            (2, None, 0, 'shirohige@gmail.com', '01203412755')]
+
+
+@pytest.fixture
+def payments(app):
+    for user_id, amount, payment_method, email, cpf in PAYMENTS:
+        db.session.add(Payment(user_id=user_id, name='x', email=email, cpf=cpf, amount=amount,
+                               payment_method=payment_method))
+
+    db.session.commit()
+
+
+def payment_ids(client, headers, query=''):
+    response = client.get(f'/payment?{query}', headers=headers)
+    assert response.status_code == 200
+
+    return [payment['payment_id'] for payment in response.get_json()['payments']]
+
+
+def all_pages(client, headers, query, limit=2):
+
+    """
+    :return: 'payment_id' of the payments of all the pages, following the 'next' cursors.
+    """
+
+    ids = []
+    after = ''
+
+    while True:
+        response = client.get(f'/payment?{query}&limit={limit}{after}', headers=headers)
+        assert response.status_code == 200
+
+        ids += [payment['payment_id'] for payment in response.get_json()['payments']]
+        cursor = response.get_json()['next']
+
+        if cursor is None:
+            return ids
+
+        after = f'&after={cursor}'
+
+
+def expected(user_id=None, descending=False):
+
+    """
+    :return: 'payment_id' of the 'PAYMENTS' sorted by amount, the ones without amount first (ascending)
+             or last (descending).
+    """
+
+    rows = [(amount, n + 1) for n, (owner, amount, *_) in enumerate(PAYMENTS) if user_id in (None, owner)]
+    rows.sort(key=lambda row: (row[0] is not None, row[0] or 0, row[1]), reverse=descending)
+
+    return [payment_id for _, payment_id in rows]
+
+
+@pytest.mark.parametrize('limit', [1, 2, 3, 10])
+def test_pages_sorted_by_amount(client, login, payments, limit):
+    headers = login('admin')
+
+    assert all_pages(client, headers, 'sort=amount', limit) == expected()
+    assert all_pages(client, headers, 'sort=-amount', limit) == expected(descending=True)
+
+
+def test_pages_sorted_by_amount_of_a_regular_user(client, login, payments):
+    headers = login('edward')
+
+    assert all_pages(client, headers, 'sort=amount') == expected(2)
+    assert all_pages(client, headers, 'sort=-amount') == expected(2, descending=True)
+
+
+def test_cursor_of_a_payment_without_amount(client, login, payments):
+    response = client.get('/payment?sort=amount&limit=1', headers=login('admin'))
+
+    assert response.get_json()['next'] == 'null,2'
+    assert payment_ids(client, login('admin'), 'sort=amount&after=null,2') == expected()[1:]
+    assert payment_ids(client, login('admin'), 'sort=-amount&after=null,5') == [2]
+
+
+def test_stream_sorted_by_amount(client, login, payments):
+    assert payment_ids(client, login('admin'), 'sort=-amount&stream=1&after=100,3') == [6, 7, 5, 2]
+
+
+@pytest.mark.parametrize('after', ['abc', '1', '1,2,3', 'null', '1,null', 'None,2'])
+def test_invalid_cursor(client, login, payments, after):
+    response = client.get(f'/payment?sort=amount&after={after}', headers=login('admin'))
+
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('query, ids', [
+    ('payment_method=boleto', [1, 5, 6, 7]),
+    ('payment_method=1', [2, 3, 4]),
+    ('min_amount=100', [1, 3, 4]),
+    ('max_amount=100', [3, 6]),
+    ('min_amount=60&max_amount=300', [1, 3, 4]),
+    ('email=roger@gmail.com', [3, 5]),
+    ('cpf=01203412755', [1, 2, 4, 7]),
+    ('user_id=1', [3, 5]),
+    ('user_id=2&payment_method=boleto&sort=-amount', [1, 6, 7]),
+])
+def test_filters(client, login, payments, query, ids):
+    assert payment_ids(client, login('admin'), query) == ids
+
+
+def test_filters_of_a_regular_user(client, login, payments):
+    headers = login('edward')
+
+    assert payment_ids(client, headers, 'email=roger@gmail.com') == []
+    assert payment_ids(client, headers, 'payment_method=credit card') == [2, 4]
+    assert client.get('/payment?user_id=1', headers=headers).status_code == 401
+
+
+@pytest.mark.parametrize('query', ['payment_method=2', 'min_amount=abc', 'max_amount=1.5', 'user_id=x', 'sort=name'])
+def test_invalid_filters(client, login, payments, query):
+    assert client.get(f'/payment?{query}', headers=login('admin')).status_code == 400
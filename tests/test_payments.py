@@ -0,0 +1,144 @@
+import datetime
+import json
+
+import pytest
+
+import app as payments_api
+from app import db, Payment, PaymentStats
+
+BOLETO = {'name': 'Edward Newgate', 'email': 'shirohige@gmail.com', 'cpf': '01203412755', 'amount': 50550,
+          'payment_method': 0}
+
+
+@pytest.mark.parametrize('limit', ['abc', '0', '-1', '1.5', ''])
+def test_invalid_limit(client, login, limit):
+    response = client.get(f'/payment?limit={limit}', headers=login('edward'))
+
+    assert response.status_code == 400
+    assert response.get_json() == {'message': 'Invalid limit!'}
+
+
+def test_limit(client, login):
+    headers = login('edward')
+
+    for _ in range(3):
+        assert client.post('/payment', json=BOLETO, headers=headers).status_code == 200
+
+    response = client.get('/payment?limit=2', headers=headers)
+
+    assert response.status_code == 200
+    assert len(response.get_json()['payments']) == 2
+    assert response.get_json()['next']
+
+
+@pytest.mark.parametrize('amount', ['100', 10.5, True, None])
+def test_invalid_amount(client, login, amount):
+    headers = login('edward')
+    response = client.post('/payment', json=dict(BOLETO, amount=amount), headers=headers)
+
+    assert response.status_code == 400
+    assert response.get_json() == {'message': 'Invalid amount!'}
+
+    response = client.post('/payment/bulk', json=[BOLETO, dict(BOLETO, amount=amount)], headers=headers)
+
+    assert response.status_code == 200
+    assert response.get_json()['created'] == 1
+    assert [result['status'] for result in response.get_json()['results']] == [200, 400]
+
+
+def test_ndjson_bulk_with_idempotency_key(client, login):
+    headers = dict(login('edward'), **{'Content-Type': 'application/x-ndjson', 'Idempotency-Key': 'bulk-1'})
+    body = '\n'.join([json.dumps(BOLETO)] * 3)
+
+    response = client.post('/payment/bulk', data=body, headers=headers)
+
+    assert response.status_code == 200
+    assert response.get_json()['created'] == 3
+
+    # The retry gets the same response back, without making the payments again...
+    retry = client.post('/payment/bulk', data=body, headers=headers)
+
+    assert retry.get_json() == response.get_json()
+    assert len(client.get('/payment', headers=login('edward')).get_json()['payments']) == 3
+
+
+def test_limited_bulk_isnt_stored_by_idempotency_key(app, client, login):
+    app.config['RATE_LIMIT_ENABLED'] = True
+    headers = dict(login('edward'), **{'Idempotency-Key': 'bulk-2'})
+    user_concurrency = app.extensions['payments']['user_concurrency']
+
+    # The user is already running as many expensive requests as allowed...
+    for _ in range(app.config['USER_MAX_CONCURRENCY']):
+        user_concurrency.acquire('edward')
+
+    assert client.post('/payment/bulk', json=[BOLETO], headers=headers).status_code == 429
+
+    for _ in range(app.config['USER_MAX_CONCURRENCY']):
+        user_concurrency.release('edward')
+
+    response = client.post('/payment/bulk', json=[BOLETO], headers=headers)
+
+    assert response.status_code == 200
+    assert response.get_json()['created'] == 1
+
+
+def test_archived_payment_ids_arent_reused(app, client, login):
+    headers = login('edward')
+
+    for _ in range(2):
+        assert client.post('/payment', json=BOLETO, headers=headers).status_code == 200
+
+    # Both payments are archived, then the newest one is deleted...
+    assert payments_api.archive_payments(datetime.datetime.utcnow() + datetime.timedelta(days=1)) == 2
+    assert client.delete('/payment/2', headers=headers).status_code == 200
+    assert client.post('/payment', json=BOLETO, headers=headers).status_code == 200
+
+    payments = client.get('/payment?archive=1', headers=headers).get_json()['payments']
+
+    assert [payment['payment_id'] for payment in payments] == [1, 3]
+
+
+def test_upgrade_db_reserves_archived_payment_ids(app, client, login):
+    columns = ', '.join(column.name for column in Payment.__table__.columns)
+
+    # A database created before the payments' table was 'AUTOINCREMENT', with an archived payment newer than the others...
+    db.session.execute(db.text('DROP TABLE payment'))
+    db.session.execute(db.text('CREATE TABLE payment (id INTEGER NOT NULL, user_id INTEGER, name VARCHAR(100), '
+                               'email VARCHAR(50), cpf VARCHAR(11), amount INTEGER, payment_method INTEGER, '
+                               'name_card VARCHAR(50), num_card VARCHAR(16), expiration VARCHAR(5), cvv INTEGER, '
+                               'created_at DATETIME, PRIMARY KEY (id))'))
+    db.session.execute(db.text(f"INSERT INTO payment ({columns}) VALUES (1, 2, 'x', 'x', '1', 10, 0, NULL, NULL, NULL, "
+                               "NULL, NULL)"))
+    db.session.execute(db.text(f"INSERT INTO payment_archive ({columns}) VALUES (5, 2, 'x', 'x', '1', 10, 0, NULL, NULL, "
+                               "NULL, NULL, NULL)"))
+    db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=['upgrade-db'])
+
+    assert 'payment: table rebuilt with AUTOINCREMENT' in result.output
+    assert client.post('/payment', json=BOLETO, headers=login('edward')).status_code == 200
+    assert db.session.query(db.func.max(Payment.id)).scalar() == 6
+
+
+def test_upgrade_db_dates_old_payments(app, client, login):
+    headers = login('edward')
+
+    for _ in range(2):
+        assert client.post('/payment', json=BOLETO, headers=headers).status_code == 200
+
+    # Payments made before 'created_at' existed...
+    Payment.query.update({'created_at': None})
+    payments_api.rebuild_payment_stats()
+
+    assert payments_api.archive_payments(datetime.datetime.utcnow()) == 0
+
+    before = datetime.datetime.utcnow()
+    result = app.test_cli_runner().invoke(args=['upgrade-db'])
+
+    assert 'payment: 2 payments without date dated by the upgrade' in result.output
+    assert all(payment.created_at >= before for payment in Payment.query)
+    assert [(row.day, row.count) for row in PaymentStats.query] == [(Payment.query.first().created_at.strftime('%Y-%m-%d'), 2)]
+
+    # They're only archived after 'PAYMENT_ARCHIVE_AFTER_DAYS'...
+    assert payments_api.archive_payments(datetime.datetime.utcnow() - datetime.timedelta(days=1)) == 0
+    assert payments_api.archive_payments(datetime.datetime.utcnow() + datetime.timedelta(days=1)) == 2
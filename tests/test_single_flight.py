@@ -0,0 +1,55 @@
+import threading
+
+import app as payments_api
+
+
+def test_errors_arent_shared(app, login, monkeypatch):
+    app.config['RATE_LIMIT_ENABLED'] = True
+    headers = login('edward')
+    state = app.extensions['payments']
+    limited, finish, joined = threading.Event(), threading.Event(), threading.Event()
+    statuses = {}
+
+    # The first request is refused by the limiter of concurrency and holds its 429 until the second one joins it...
+    too_many_requests = payments_api.too_many_requests
+
+    def slow_too_many_requests(retry_after):
+        limited.set()
+        finish.wait(5)
+        return too_many_requests(retry_after)
+
+    join = state['single_flight'].join
+
+    def join_and_notify(key):
+        call, leader = join(key)
+
+        if not leader:
+            joined.set()
+
+        return call, leader
+
+    monkeypatch.setattr(payments_api, 'too_many_requests', slow_too_many_requests)
+    monkeypatch.setattr(state['single_flight'], 'join', join_and_notify)
+
+    def get(name):
+        statuses[name] = app.test_client().get('/payment', headers=headers).status_code
+
+    for _ in range(app.config['USER_MAX_CONCURRENCY']):
+        state['user_concurrency'].acquire('edward')
+
+    first = threading.Thread(target=get, args=('first',))
+    first.start()
+    assert limited.wait(5)
+
+    for _ in range(app.config['USER_MAX_CONCURRENCY']):
+        state['user_concurrency'].release('edward')
+
+    second = threading.Thread(target=get, args=('second',))
+    second.start()
+    assert joined.wait(5)
+
+    finish.set()
+    first.join(5)
+    second.join(5)
+
+    assert statuses == {'first': 429, 'second': 200}
@@ -0,0 +1,79 @@
+import datetime
+
+import pytest
+
+from app import db, Payment, PaymentStats, update_payment_stats, rebuild_payment_stats
+
+
+def make_payment(user_id, amount, payment_method, created_at):
+    payment = Payment(user_id=user_id, name='x', email='x', cpf='1', amount=amount, payment_method=payment_method,
+                      created_at=created_at)
+    db.session.add(payment)
+    update_payment_stats([payment], 1)
+    db.session.commit()
+
+    return payment
+
+
+@pytest.fixture
+def payments(app):
+    return [make_payment(2, 100, 0, datetime.datetime(2022, 4, 10, 12)),
+            make_payment(2, 250, 1, datetime.datetime(2022, 4, 10, 18)),
+            make_payment(2, 50, 0, datetime.datetime(2022, 5, 1, 9)),
+            make_payment(1, 1000, 0, datetime.datetime(2022, 5, 2, 9))]
+
+
+def stats(client, headers, query=''):
+    response = client.get(f'/payment/stats{query}', headers=headers)
+    assert response.status_code == 200
+
+    return response.get_json()['stats']
+
+
+def test_totals(client, login, payments):
+    output = stats(client, login('admin'))
+
+    assert output['totals'] == {'count': 4, 'total': 1400, 'by_method': {'boleto': {'count': 3, 'total': 1150},
+                                                                         'credit card': {'count': 1, 'total': 250}}}
+    assert [(user['user_id'], user['count'], user['total']) for user in output['users']] == [(1, 1, 1000), (2, 3, 400)]
+
+
+def test_regular_user_only_gets_their_stats(client, login, payments):
+    output = stats(client, login('edward'), '?user_id=1')
+
+    assert output['totals']['count'] == 3
+    assert [user['user_id'] for user in output['users']] == [2]
+
+
+def test_buckets(client, login, payments):
+    headers = login('admin')
+
+    days = stats(client, headers, '?bucket=day')['buckets']
+    months = stats(client, headers, '?bucket=month')['buckets']
+
+    assert [(day['bucket'], day['count'], day['total']) for day in days] == \
+        [('2022-04-10', 2, 350), ('2022-05-01', 1, 50), ('2022-05-02', 1, 1000)]
+    assert [(month['bucket'], month['count'], month['total']) for month in months] == \
+        [('2022-04', 2, 350), ('2022-05', 2, 1050)]
+    assert client.get('/payment/stats?bucket=year', headers=headers).status_code == 400
+
+
+def test_deleted_payment_leaves_the_stats(client, login, payments):
+    headers = login('admin')
+
+    assert client.delete(f'/payment/{payments[1].id}', headers=headers).status_code == 200
+
+    totals = stats(client, headers)['totals']
+
+    assert (totals['count'], totals['total']) == (3, 1150)
+    assert totals['by_method'] == {'boleto': {'count': 3, 'total': 1150}}
+
+
+def test_rebuild_gives_the_same_stats(client, login, payments):
+    before = sorted((row.user_id, row.payment_method, row.day, row.count, row.total) for row in PaymentStats.query.all())
+
+    rebuild_payment_stats()
+
+    after = sorted((row.user_id, row.payment_method, row.day, row.count, row.total) for row in PaymentStats.query.all())
+
+    assert after == before
@@ -0,0 +1,60 @@
+import time
+
+from app import TokenCache, UserSnapshot, User
+
+
+def test_verified_token_is_cached(app, client, login, monkeypatch):
+    headers = login('edward')
+    assert client.get('/payment', headers=headers).status_code == 200
+
+    # The token isn't verified again (nor its user read) while it's cached...
+    def verify(token):
+        raise AssertionError('The token was verified again')
+
+    monkeypatch.setattr(app.extensions['payments']['token_service'], 'verify', verify)
+
+    assert client.get('/payment', headers=headers).status_code == 200
+
+
+def test_cached_token_expires(app):
+    cache = TokenCache(10, 300)
+    user = UserSnapshot(User(id=2, public_id='edward', username='edward', admin=False))
+
+    cache.put('expired', {'exp': time.time() - 1}, user)
+    cache.put('valid', {'exp': time.time() + 60}, user)
+
+    assert cache.get('expired') is None
+    assert cache.get('valid')[1] is user
+
+    # The cache doesn't trust a token for longer than its max TTL, even if the token is still valid...
+    short = TokenCache(10, 0)
+    short.put('valid', {'exp': time.time() + 60}, user)
+
+    assert short.get('valid') is None
+
+
+def test_cache_is_bounded(app):
+    cache = TokenCache(2, 300)
+    user = UserSnapshot(User(id=2, public_id='edward', username='edward', admin=False))
+
+    for token in ('a', 'b', 'c'):
+        cache.put(token, {'exp': time.time() + 60}, user)
+
+    assert cache.get('a') is None
+    assert cache.get('b') and cache.get('c')
+
+
+def test_promoted_user_isnt_served_from_cache(client, login):
+    admin, edward = login('admin'), login('edward')
+
+    assert client.get('/user', headers=edward).status_code == 401
+    assert client.put('/user/edward', headers=admin).status_code == 200
+    assert client.get('/user', headers=edward).status_code == 200
+
+
+def test_deleted_user_isnt_served_from_cache(client, login):
+    admin, edward = login('admin'), login('edward')
+
+    assert client.get('/payment', headers=edward).status_code == 200
+    assert client.delete('/user/edward', headers=admin).status_code == 200
+    assert client.get('/payment', headers=edward).status_code == 401
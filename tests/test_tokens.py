@@ -0,0 +1,41 @@
+import jwt
+import pytest
+
+from app import create_app, parse_token_keys, TokenService
+
+
+def test_secret_key_is_retired_by_rotation():
+    before = TokenService('old-secret', parse_token_keys(''), 900)
+    token = before.issue('edward')
+    forged = jwt.encode({'public_id': 'admin', 'exp': 2 ** 40}, 'secret', algorithm='HS256')
+
+    assert before.verify(token)['public_id'] == 'edward'
+
+    # While the keys are rotated, the tokens without 'kid' are only accepted if their key is listed...
+    rotating = TokenService('old-secret', parse_token_keys('k1:new-secret,:old-secret'), 900)
+
+    assert rotating.verify(token)['public_id'] == 'edward'
+    assert rotating.verify(rotating.issue('edward'))['public_id'] == 'edward'
+
+    rotated = TokenService('old-secret', parse_token_keys('k1:new-secret'), 900)
+
+    for retired in (token, forged):
+        with pytest.raises(jwt.InvalidTokenError):
+            rotated.verify(retired)
+
+
+def test_token_of_default_secret_is_refused(app, client):
+    app.extensions['payments']['token_service'] = TokenService(app.config['SECRET_KEY'], parse_token_keys('k1:new'), 900)
+    forged = jwt.encode({'public_id': 'admin', 'exp': 2 ** 40}, 'secret', algorithm='HS256')
+
+    assert client.get('/user', headers={'X-Access-Token': forged}).status_code == 401
+
+
+def test_default_secret_key_only_in_debug_mode(tmp_path):
+    uri = f"sqlite:///{tmp_path / 'test.db'}"
+
+    with pytest.raises(RuntimeError):
+        create_app({'SQLALCHEMY_DATABASE_URI': uri, 'SECRET_KEY': 'secret'})
+
+    assert create_app({'SQLALCHEMY_DATABASE_URI': uri, 'SECRET_KEY': 'secret', 'DEBUG': True})
+    assert create_app({'SQLALCHEMY_DATABASE_URI': uri, 'SECRET_KEY': 'production-secret'})
@@ -0,0 +1,41 @@
+from app import db, User
+
+
+def create_user(client, headers, username):
+    assert client.post('/user', json={'username': username, 'password': 'x'}, headers=headers).status_code == 200
+
+    return User.query.filter_by(username=username).one()
+
+
+def test_id_of_deleted_user_isnt_reused(client, login):
+    headers = login('admin')
+    luffy = create_user(client, headers, 'luffy')
+    luffy_id, luffy_public_id = luffy.id, luffy.public_id
+
+    assert client.delete(f'/user/{luffy_public_id}', headers=headers).status_code == 200
+
+    assert create_user(client, headers, 'zoro').id > luffy_id
+
+
+def test_upgrade_db_adds_autoincrement(app):
+    # A database created before the users' table was 'AUTOINCREMENT'...
+    db.session.execute(db.text('DROP TABLE user'))
+    db.session.execute(db.text('CREATE TABLE user (id INTEGER NOT NULL, public_id VARCHAR(50), username VARCHAR(50), '
+                               'password VARCHAR(200), admin BOOLEAN, PRIMARY KEY (id), UNIQUE (public_id))'))
+    db.session.execute(db.text("INSERT INTO user (id, public_id, username, admin) VALUES (1, 'a', 'admin', 1), "
+                               "(2, 'b', 'luffy', 0)"))
+    db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=['upgrade-db'])
+
+    assert 'user: table rebuilt with AUTOINCREMENT' in result.output
+    assert [(user.id, user.username) for user in User.query.all()] == [(1, 'admin'), (2, 'luffy')]
+    assert 'ix_user_username' in {index['name'] for index in db.inspect(db.engine).get_indexes('user')}
+
+    db.session.delete(User.query.get(2))
+    db.session.commit()
+    db.session.add(User(public_id='c', username='zoro', admin=False))
+    db.session.commit()
+
+    assert User.query.filter_by(username='zoro').one().id == 3
+    assert 'user: table rebuilt' not in app.test_cli_runner().invoke(args=['upgrade-db']).output